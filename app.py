@@ -1,38 +1,84 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from quart import Quart, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+from quart.typing import ResponseReturnValue
+from quart_cors import cors
 import os
-import tempfile
-import requests
+import logging
+import csv
+import asyncio
+from types import MappingProxyType
+from typing import Any, Dict, Optional
+from functools import lru_cache
+import hashlib
+import aiohttp
+import orjson
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
 from dotenv import load_dotenv
-import json
-import base64
-from io import BytesIO
+from werkzeug.exceptions import HTTPException
+import pybase64
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app, resources={
-    r"/*": {
-        "origins": ["*"],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
-    }
-})
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("app")
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson - much faster for large processing_info payloads"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app = Quart(__name__)
+app.json = OrjsonProvider(app)
+app = cors(
+    app,
+    allow_origin="*",
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type"]
+)
 
 # Configuration for external LLM API
 LLM_API_BASE_URL = os.getenv("LLM_API_BASE_URL")  # e.g., https://api.anthropic.com/v1/messages
 LLM_API_KEY = os.getenv("LLM_API_KEY")
 LLM_MODEL = os.getenv("LLM_MODEL", "claude-3-sonnet-20240229")  # Default to Claude Sonnet
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+MAX_REQUEST_SIZE = MAX_FILE_SIZE + 1024 * 1024  # File plus form fields/multipart overhead
 
+# Reject oversized bodies while they stream in, before they are spooled
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_SIZE
 
-load_dotenv()
-print("Anthropic key exists:", os.getenv("ANTHROPIC_API_KEY"))
-print("OpenAI key exists:", bool(os.getenv("OPENAI_API_KEY")))
+# Shared HTTP client for all LLM calls - created once the event loop is running
+HTTP_SESSION = None
+
+# Retry policy for transient LLM API failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.5
+MAX_RETRY_AFTER = 60  # Cap on a provider's Retry-After, in seconds
+MAX_CALL_DURATION = 180  # Overall budget for one LLM call across all attempts, in seconds
+LIMITER_POLL_INTERVAL = 0.1  # How often a call waiting on the RPM/TPM budgets re-checks them, in seconds
+
+# Default per-provider throttles: requests/min, tokens/min and max in-flight requests
+PROVIDER_RATE_LIMITS = MappingProxyType({
+    "anthropic": {"rpm": 50, "tpm": 80000, "max_concurrency": 10},
+    "openai": {"rpm": 60, "tpm": 150000, "max_concurrency": 10},
+    "azure_openai": {"rpm": 60, "tpm": 120000, "max_concurrency": 10},
+    "google": {"rpm": 60, "tpm": 120000, "max_concurrency": 10}
+})
+
+# Successful LLM answers keyed by (file hash, filename, question, provider, model)
+RESPONSE_CACHE = TTLCache(maxsize=1024, ttl=3600)
 
 # Supported LLM providers
-SUPPORTED_PROVIDERS = {
+SUPPORTED_PROVIDERS = MappingProxyType({
     "anthropic": {
         "base_url": "https://api.anthropic.com/v1/messages",
         "supports_files": True,
@@ -48,25 +94,172 @@ SUPPORTED_PROVIDERS = {
         "supports_files": True,
         "file_types": ["text/csv"]
     }
-}
+})
 
 # Token limits for different models
-TOKEN_LIMITS = {
+TOKEN_LIMITS = MappingProxyType({
     "gpt-4": 8192,
     "gpt-4-32k": 32768,
     "gpt-4o": 50000,
     "gpt-4-turbo": 128000,
     "gpt-35-turbo": 4096,
     "gpt-35-turbo-16k": 16385
+})
+
+# Characters tokenized when estimating the token count of large prompts
+TOKEN_ESTIMATE_SAMPLE_CHARS = 10000
+
+# Prompt templates - the static text is built once, only per-request values are filled in
+ANTHROPIC_PROMPT_FMT = "I have uploaded a CSV file named '{filename}'. Please analyze this data and answer the following question: {question}"
+
+AZURE_SYSTEM_PROMPT = "You are a helpful assistant that analyzes CSV data and answers questions about it. You have been provided with the complete extracted data from a CSV file. Provide detailed, accurate analysis based on ALL the data provided."
+AZURE_PROMPT_HEAD = "I have uploaded a CSV file and extracted its COMPLETE contents. Here is the full processed data:\n\n"
+AZURE_SUMMARY_HEADER_FMT = "File: {filename}\nTotal Rows: {rows}\nTotal Columns: {column_count}\nColumn Names: {columns}\n\nCOMPLETE RAW CSV CONTENT:\n"
+AZURE_PROMPT_TAIL_FMT = "\n\n\nUser Question: {question}\n\nPlease analyze ALL the data and provide a comprehensive answer to the user's question."
+
+class ProviderLimiter:
+    """Throttle for one provider: concurrency cap plus request and token per-minute budgets"""
+    
+    def __init__(self, rpm, tpm, max_concurrency):
+        self.tpm = tpm
+        self.requests = AsyncLimiter(rpm, 60)
+        self.tokens = AsyncLimiter(tpm, 60)
+        self.concurrency = asyncio.Semaphore(max_concurrency)
+    
+    async def _wait_and_take(self, tokens):
+        await self.concurrency.acquire()
+        try:
+            # Wait until both budgets have room, then take both without yielding in between,
+            # so being cancelled while waiting leaves no request/token permit taken
+            while not (self.requests.has_capacity() and self.tokens.has_capacity(tokens)):
+                await asyncio.sleep(LIMITER_POLL_INTERVAL)
+            await self.requests.acquire()
+            await self.tokens.acquire(tokens)
+        except BaseException:
+            self.concurrency.release()
+            raise
+    
+    async def acquire(self, tokens, timeout):
+        """Take a concurrency slot plus request/token budget, waiting at most timeout seconds"""
+        await asyncio.wait_for(self._wait_and_take(min(tokens, self.tpm)), timeout)
+    
+    def release(self):
+        """Give back the concurrency slot taken by acquire()"""
+        self.concurrency.release()
+
+# Every worker process holds its own limiters, so split the provider budgets between them
+WORKER_COUNT = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+
+LIMITERS = {
+    provider: ProviderLimiter(
+        rpm=max(limits["rpm"] // WORKER_COUNT, 1),
+        tpm=max(limits["tpm"] // WORKER_COUNT, 1),
+        max_concurrency=max(limits["max_concurrency"] // WORKER_COUNT, 1)
+    )
+    for provider, limits in PROVIDER_RATE_LIMITS.items()
 }
 
+@app.before_serving
+async def create_http_session():
+    """Create the pooled aiohttp session reused by every LLM call"""
+    global HTTP_SESSION
+    HTTP_SESSION = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=50,
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
+    )
+
+@app.after_serving
+async def close_http_session():
+    """Close the shared aiohttp session on shutdown"""
+    if HTTP_SESSION is not None:
+        await HTTP_SESSION.close()
+
+def parse_retry_after(value):
+    """Parse a Retry-After header given in seconds; None if missing or not numeric"""
+    try:
+        return min(max(float(value), 0), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return None
+
+async def post_json(provider, url, headers, payload, timeout, provider_name, estimated_tokens=None):
+    """
+    POST a JSON payload over the shared session.
+    Requests go through the provider's limiter; 429/5xx responses and connection
+    errors are retried, honoring Retry-After when the provider sends one.
+    All attempts together are bounded by MAX_CALL_DURATION.
+    estimated_tokens is charged to the provider's TPM budget; without it the
+    serialized body size is used as a rough stand-in
+    """
+    # Serialize once up front - the body can be several MB and is reused across retries
+    body = orjson.dumps(payload)
+    if estimated_tokens is None:
+        estimated_tokens = len(body) // 4
+    limiter = LIMITERS[provider]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_CALL_DURATION
+    
+    for attempt in range(MAX_RETRIES + 1):
+        last_attempt = attempt == MAX_RETRIES
+        retry_after = None
+        
+        # Queueing on the limiter counts against the deadline too
+        try:
+            await limiter.acquire(estimated_tokens, timeout=deadline - loop.time())
+        except asyncio.TimeoutError:
+            raise Exception(f"{provider_name} API call exceeded the {MAX_CALL_DURATION}s deadline waiting for rate limits")
+        
+        try:
+            # Never let a single attempt run past the overall deadline
+            attempt_timeout = min(timeout, deadline - loop.time())
+            if attempt_timeout <= 0:
+                raise Exception(f"{provider_name} API call exceeded the {MAX_CALL_DURATION}s deadline")
+            
+            async with HTTP_SESSION.post(
+                url,
+                headers=headers,
+                data=body,
+                timeout=aiohttp.ClientTimeout(total=attempt_timeout)
+            ) as response:
+                if response.status == 200:
+                    return orjson.loads(await response.read())
+                error = Exception(f"{provider_name} API error: {response.status} - {await response.text()}")
+                if response.status not in RETRY_STATUSES or last_attempt:
+                    raise error
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        except asyncio.TimeoutError:
+            # str() of a timeout is empty - give the client something readable
+            raise Exception(f"{provider_name} API timed out after {attempt_timeout:.0f}s")
+        except aiohttp.ClientConnectionError as connection_error:
+            if last_attempt:
+                raise
+            error = connection_error
+        finally:
+            limiter.release()
+        
+        if retry_after is None:
+            retry_after = RETRY_BACKOFF_FACTOR * (2 ** attempt)
+        
+        # Give up with the last error rather than sleep past the overall deadline
+        if loop.time() + retry_after >= deadline:
+            raise error
+        await asyncio.sleep(retry_after)
+
+@app.errorhandler(413)
+async def request_too_large(error):
+    """Return the usual JSON error when the upload exceeds MAX_CONTENT_LENGTH"""
+    return jsonify({"error": "File size exceeds 16MB limit"}), 413
+
 @app.route('/health', methods=['GET'])
-def health_check():
+async def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Flask app is running"})
+    return jsonify({"status": "healthy", "message": "Quart app is running"})
 
 @app.route('/chat', methods=['POST'])
-def chat():
+async def chat() -> ResponseReturnValue:
     """
     Process Q/A request with CSV file
     Expects:
@@ -74,52 +267,58 @@ def chat():
     - 'question': Question to ask about the CSV data
     """
     try:
+        files = await request.files
+        form = await request.form
+        
         # Validate request
-        if 'file' not in request.files:
+        if 'file' not in files:
             return jsonify({"error": "No file provided"}), 400
         
-        if 'question' not in request.form:
+        if 'question' not in form:
             return jsonify({"error": "No question provided"}), 400
         
-        file = request.files['file']
-        question = request.form['question']
+        file = files['file']
+        question = form['question']
         
         # Validate file
-        if file.filename == '':
+        if not file.filename:
             return jsonify({"error": "No file selected"}), 400
         
         if not file.filename.lower().endswith('.csv'):
             return jsonify({"error": "Only CSV files are supported"}), 400
         
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)  # Reset file pointer
+        # Get file content as bytes without processing - MAX_CONTENT_LENGTH already
+        # bounds the body, so the size is taken from the bytes instead of seeking the stream
+        file_content = file.read()
+        file_size = len(file_content)
         
         if file_size > MAX_FILE_SIZE:
-            return jsonify({"error": "File size exceeds 16MB limit"}), 400
+            return jsonify({"error": "File size exceeds 16MB limit"}), 413
         
-        # Get file content as bytes without processing
-        file_content = file.read()
-        file.seek(0)  # Reset for potential future use
+        # LLM provider is resolved once at startup
+        provider = LLM_PROVIDER
         
-        # Determine LLM provider and call appropriate API
-        provider = determine_llm_provider()
+        # Identical file + question for the same model is answered from cache
+        cache_key = build_cache_key(file_content, file.filename, question, provider, LLM_PROVIDER_MODEL)
+        result = RESPONSE_CACHE.get(cache_key)
+        cache_hit = result is not None
         
         try:
-            if provider == "azure_openai":
+            if cache_hit:
+                processing_method = result["processing_info"]["processing_method"]
+            elif provider == "azure_openai":
                 # Azure OpenAI: Extract content first, then send
-                result = call_azure_openai_api(file_content, file.filename, question)
+                result = await call_azure_openai_api(file_content, file.filename, question)
                 processing_method = "extracted_content"
             elif provider == "anthropic":
                 # Anthropic: Direct file upload (no extraction)
-                result = call_anthropic_api(file_content, file.filename, question)
+                result = await call_anthropic_api(file_content, file.filename, question)
                 processing_method = "direct_file_upload"
             elif provider == "openai":
-                result = call_openai_api(file_content, file.filename, question)
+                result = await call_openai_api(file_content, file.filename, question)
                 processing_method = "text_extraction"
             elif provider == "google":
-                result = call_google_api(file_content, file.filename, question)
+                result = await call_google_api(file_content, file.filename, question)
                 processing_method = "text_extraction"
             else:
                 return jsonify({"error": "No supported LLM provider configured"}), 500
@@ -127,6 +326,9 @@ def chat():
             # Add processing method to response
             result["processing_info"]["processing_method"] = processing_method
             
+            if not cache_hit:
+                RESPONSE_CACHE[cache_key] = result
+            
             return jsonify({
                 "success": True,
                 "question": question,
@@ -136,16 +338,20 @@ def chat():
                 "csv_rows": result.get("processing_info", {}).get("data_rows", "unknown"),
                 "csv_columns": result.get("processing_info", {}).get("data_columns", []),
                 "processing_info": result.get("processing_info", {}),
-                "provider_used": provider
+                "provider_used": provider,
+                "cache_hit": cache_hit
             })
             
         except Exception as e:
             return jsonify({"error": f"Error calling LLM API: {str(e)}"}), 500
         
+    except HTTPException:
+        # Body/form parsing errors (413, 400, 408) keep their own status codes
+        raise
     except Exception as e:
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
-def determine_llm_provider():
+def determine_llm_provider() -> Optional[str]:
     """Determine which LLM provider to use based on environment variables"""
     if os.getenv("AZURE_OPENAI_API_KEY"):
         return "azure_openai"
@@ -158,14 +364,37 @@ def determine_llm_provider():
     else:
         return None
 
-def call_anthropic_api(file_content, filename, question):
+def get_provider_model(provider):
+    """Return the model/deployment name the given provider will be called with"""
+    if provider == "azure_openai":
+        return os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
+    elif provider == "anthropic":
+        return os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229")
+    elif provider == "openai":
+        return os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview")
+    elif provider == "google":
+        return os.getenv("GOOGLE_MODEL", "gemini-pro")
+    else:
+        return None
+
+# Provider and model are fixed by the environment, so resolve them once at import.
+# Restarting the workers (e.g. gunicorn HUP) picks up changes; /debug-env stays live
+LLM_PROVIDER = determine_llm_provider()
+LLM_PROVIDER_MODEL = get_provider_model(LLM_PROVIDER)
+
+def build_cache_key(file_content, filename, question, provider, model):
+    """Build the response cache key for a file/question pair"""
+    file_hash = hashlib.blake2b(file_content, digest_size=16).hexdigest()
+    return (file_hash, filename, question, provider, model)
+
+async def call_anthropic_api(file_content: bytes, filename: str, question: str) -> Dict[str, Any]:
     """Call Anthropic Claude API with file content"""
     api_key = os.getenv("ANTHROPIC_API_KEY")
     if not api_key:
         raise Exception("ANTHROPIC_API_KEY not found in environment variables")
     
-    # Encode file content to base64
-    file_base64 = base64.b64encode(file_content).decode('utf-8')
+    # Encode file content to base64 - SIMD-accelerated, straight to str without a bytes copy
+    file_base64 = pybase64.b64encode_as_string(file_content)
     
     headers = {
         "x-api-key": api_key,
@@ -174,7 +403,7 @@ def call_anthropic_api(file_content, filename, question):
     }
     
     payload = {
-        "model": os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229"),
+        "model": get_provider_model("anthropic"),
         "max_tokens": 1500,
         "messages": [
             {
@@ -182,7 +411,7 @@ def call_anthropic_api(file_content, filename, question):
                 "content": [
                     {
                         "type": "text",
-                        "text": f"I have uploaded a CSV file named '{filename}'. Please analyze this data and answer the following question: {question}"
+                        "text": ANTHROPIC_PROMPT_FMT.format(filename=filename, question=question)
                     },
                     {
                         "type": "document",
@@ -197,17 +426,15 @@ def call_anthropic_api(file_content, filename, question):
         ]
     }
     
-    response = requests.post(
+    result = await post_json(
+        "anthropic",
         "https://api.anthropic.com/v1/messages",
-        headers=headers,
-        json=payload,
-        timeout=60
+        headers,
+        payload,
+        timeout=60,
+        provider_name="Anthropic",
+        estimated_tokens=len(file_content) // 3  # CSV tokenizes at roughly 3 bytes per token
     )
-    
-    if response.status_code != 200:
-        raise Exception(f"Anthropic API error: {response.status_code} - {response.text}")
-    
-    result = response.json()
     return {
         "answer": result["content"][0]["text"],
         "processing_info": {
@@ -217,125 +444,138 @@ def call_anthropic_api(file_content, filename, question):
         }
     }
 
-def call_azure_openai_api(file_content, filename, question):
+@lru_cache(maxsize=1)
+def get_token_encoding():
+    """
+    Load the tiktoken encoding for Azure OpenAI token validation on first use.
+    A failed load (e.g. the BPE file download) raises and is not cached, so the
+    next request tries again
+    """
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-4")
+
+def estimate_tokens(encoding, text):
+    """
+    Estimate the token count of text without encoding all of it.
+    Small texts are counted exactly; large ones extrapolate from a sample
+    taken from the middle, where the CSV rows are.
+    Returns (token_count, is_estimate)
+    """
+    if len(text) <= TOKEN_ESTIMATE_SAMPLE_CHARS:
+        return len(encoding.encode_ordinary(text)), False
+    
+    start = (len(text) - TOKEN_ESTIMATE_SAMPLE_CHARS) // 2
+    sample = text[start:start + TOKEN_ESTIMATE_SAMPLE_CHARS]
+    sample_tokens = len(encoding.encode_ordinary(sample))
+    return sample_tokens * len(text) // len(sample), True
+
+async def call_azure_openai_api(file_content: bytes, filename: str, question: str) -> Dict[str, Any]:
     """Call Azure OpenAI API with extracted file content - FULL CONTENT EXTRACTION"""
     api_key = os.getenv("AZURE_OPENAI_API_KEY")
     endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-    deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
+    deployment_name = get_provider_model("azure_openai")
     api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
     
     if not api_key or not endpoint:
         raise Exception("AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT required")
     
-    # Initialize variables
-    csv_rows = "unknown"
-    csv_columns = []
-    
-    # For Azure OpenAI: Extract and process FULL CSV content
+    # For Azure OpenAI: send the FULL raw CSV text - the model only ever sees text,
+    # so parsing into a DataFrame and re-formatting it would be pure overhead
     try:
-        import pandas as pd
-        from io import BytesIO
-        
-        # Read CSV and extract structured data
-        df = pd.read_csv(BytesIO(file_content))
-        csv_rows = len(df)
-        csv_columns = df.columns.tolist()
-        
-        # Create FULL data summary - NO TRUNCATION
-        print(f"📊 Processing full CSV content: {csv_rows} rows, {len(csv_columns)} columns")
-        
-        # Convert entire dataframe to string representation
-        full_data_string = df.to_string(index=False)
-        
-        # Get complete data types and statistics
-        data_types_string = df.dtypes.to_string()
-        basic_stats_string = df.describe(include='all').to_string()
-        
-        # Create comprehensive data summary with ALL content
-        data_summary = f"""File: {filename}
-Total Rows: {csv_rows}
-Total Columns: {len(csv_columns)}
-Column Names: {csv_columns}
-
-COMPLETE DATA CONTENT:
-{full_data_string}
-
-DATA TYPES:
-{data_types_string}
-
-COMPLETE STATISTICAL SUMMARY:
-{basic_stats_string}
-"""
-        
-        print(f"📝 Full data summary created - Length: {len(data_summary):,} characters")
-
-    except Exception as e:
-        print(f"❌ Pandas processing failed: {str(e)}")
-        # Fallback to raw text - FULL CONTENT
-        try:
-            csv_text = file_content.decode('utf-8')
-            print(f"📝 Using raw CSV text - Length: {len(csv_text):,} characters")
-            
-            # Extract ALL content as text
-            data_summary = f"""CSV File: {filename}
-
-COMPLETE RAW CSV CONTENT:
-{csv_text}
-"""
-            
-            # Try to get basic info from raw text
-            lines = csv_text.split('\n')
-            if len(lines) > 0:
-                csv_columns = [col.strip() for col in lines[0].split(',')]
-                csv_rows = len(lines) - 1  # Subtract header row
-                
-            print(f"📊 Raw processing: {csv_rows} rows, {len(csv_columns)} columns")
-            
-        except Exception as decode_error:
-            raise Exception(f"Unable to process CSV file: {str(decode_error)}")
+        csv_text = file_content.decode('utf-8-sig')  # utf-8-sig drops the BOM Excel's "CSV UTF-8" export writes
+    except UnicodeDecodeError:
+        raise Exception("Unable to decode CSV file as UTF-8")
+    
+    # Basic info without a full parse: header row for columns, newline count for rows.
+    # Only the header line goes through csv.reader - wrapping the whole text in a StringIO
+    # would copy the entire file into a 4-bytes-per-character buffer
+    header_line = csv_text.partition('\n')[0]
+    csv_columns = [col.strip() for col in next(csv.reader([header_line]), [])]
+    line_count = file_content.count(b'\n')
+    if file_content and not file_content.endswith(b'\n'):
+        line_count += 1
+    csv_rows = max(line_count - 1, 0)  # Subtract header row
+    
+    logger.debug("📊 Processing full CSV content: %d rows, %d columns", csv_rows, len(csv_columns))
+    
+    # Data summary with ALL content - NO TRUNCATION. The CSV text is joined straight into
+    # the prompt so the multi-MB data is copied once rather than into a summary and again
+    summary_header = AZURE_SUMMARY_HEADER_FMT.format(
+        filename=filename,
+        rows=csv_rows,
+        column_count=len(csv_columns),
+        columns=csv_columns
+    )
+    content_length = len(summary_header) + len(csv_text)
+    
+    logger.debug("📝 Full data summary created - Length: %d characters", content_length)
     
     # Add token counting with the complete data
-    print(f"🔍 Starting token analysis for full content...")
+    logger.debug("🔍 Starting token analysis for full content...")
     
     # Prepare the complete prompt
-    system_prompt = "You are a helpful assistant that analyzes CSV data and answers questions about it. You have been provided with the complete extracted data from a CSV file. Provide detailed, accurate analysis based on ALL the data provided."
+    system_prompt = AZURE_SYSTEM_PROMPT
+    
+    user_prompt = "".join([
+        AZURE_PROMPT_HEAD,
+        summary_header,
+        csv_text,
+        AZURE_PROMPT_TAIL_FMT.format(question=question)
+    ])
     
-    user_prompt = f"I have uploaded a CSV file and extracted its COMPLETE contents. Here is the full processed data:\n\n{data_summary}\n\nUser Question: {question}\n\nPlease analyze ALL the data and provide a comprehensive answer to the user's question."
+    # Input tokens charged to the rate limiter - None falls back to the body size
+    input_tokens = None
     
-    # Count tokens for the complete content
+    # Count tokens for the complete content - the first load may download the BPE file,
+    # so it runs in a worker thread
     try:
-        import tiktoken
-        
-        # Get encoding for the model
-        if "gpt-4" in deployment_name.lower():
-            encoding = tiktoken.encoding_for_model("gpt-4")
-        else:
-            encoding = tiktoken.encoding_for_model("gpt-4")  # Default
-        
-        system_tokens = len(encoding.encode(system_prompt))
-        user_tokens = len(encoding.encode(user_prompt))
-        total_input_tokens = system_tokens + user_tokens + 10  # +10 for message overhead
-        
-        # Check against model limits
-        model_limit = TOKEN_LIMITS.get(deployment_name, 50000)
-        max_response_tokens = 2000
-        total_tokens_needed = total_input_tokens + max_response_tokens
-        
-        print(f"📊 Complete Token Analysis:")
-        print(f"   System prompt: {system_tokens:,} tokens")
-        print(f"   User content (full data + question): {user_tokens:,} tokens")
-        print(f"   Total input: {total_input_tokens:,} tokens")
-        print(f"   Response reserve: {max_response_tokens:,} tokens")
-        print(f"   Total needed: {total_tokens_needed:,} tokens")
-        print(f"   Model limit: {model_limit:,} tokens")
-        
-        if total_tokens_needed > model_limit:
-            excess_tokens = total_tokens_needed - model_limit
-            raise Exception(f"""TOKEN_LIMIT_EXCEEDED: Full CSV content exceeds token limits for model {deployment_name}.
+        encoding = await asyncio.to_thread(get_token_encoding)
+    except ImportError:
+        encoding = None
+        logger.warning("⚠️ tiktoken not available, skipping token validation")
+    except Exception as encoding_error:
+        encoding = None
+        logger.warning("⚠️ Unable to load tiktoken encoding, skipping token validation: %s", encoding_error)
+    
+    if encoding is not None:
+        try:
+            model_limit = TOKEN_LIMITS.get(deployment_name, 50000)
+            max_response_tokens = 2000
+            
+            # encode_ordinary skips the special-token scan
+            system_tokens = len(encoding.encode_ordinary(system_prompt))
+            user_tokens, tokens_estimated = estimate_tokens(encoding, user_prompt)
+            
+            # Only run the full (multi-MB) encode when the estimate lands within 10% of the limit.
+            # It runs in a worker thread (tiktoken releases the GIL) so it doesn't stall the event loop
+            estimated_total = system_tokens + user_tokens + 10 + max_response_tokens
+            if tokens_estimated and 0.9 * model_limit <= estimated_total <= 1.1 * model_limit:
+                user_tokens = len(await asyncio.to_thread(encoding.encode_ordinary, user_prompt))
+                tokens_estimated = False
+            
+            total_input_tokens = system_tokens + user_tokens + 10  # +10 for message overhead
+            input_tokens = total_input_tokens
+            total_tokens_needed = total_input_tokens + max_response_tokens
+            estimate_note = " (estimated)" if tokens_estimated else ""
+            
+            logger.debug(
+                "📊 Complete Token Analysis: system prompt %d, user content (full data + question) %d%s, "
+                "total input %d, response reserve %d, total needed %d, model limit %d tokens",
+                system_tokens, user_tokens, estimate_note, total_input_tokens,
+                max_response_tokens, total_tokens_needed, model_limit
+            )
+            
+        except Exception as token_error:
+            logger.warning("⚠️ Token counting error: %s", token_error)
+    
+    # Checked outside the try above so the rejection reaches the client instead of being logged
+    if input_tokens is not None and total_tokens_needed > model_limit:
+        excess_tokens = total_tokens_needed - model_limit
+        raise Exception(f"""TOKEN_LIMIT_EXCEEDED: Full CSV content exceeds token limits for model {deployment_name}.
 
 📊 Full Content Token Analysis:
 • System prompt: {system_tokens:,} tokens
-• Complete CSV data + question: {user_tokens:,} tokens
+• Complete CSV data + question: {user_tokens:,} tokens{estimate_note}
 • Total input tokens: {total_input_tokens:,} tokens
 • Reserved for response: {max_response_tokens:,} tokens
 • Total tokens needed: {total_tokens_needed:,} tokens
@@ -344,11 +584,6 @@ COMPLETE RAW CSV CONTENT:
 
 💡 The complete CSV file is too large for this model.
    Try using a model with higher token limits or split your data into smaller files.""")
-        
-    except ImportError:
-        print("⚠️ tiktoken not available, skipping token validation")
-    except Exception as token_error:
-        print(f"⚠️ Token counting error: {token_error}")
     
     # Clean endpoint URL
     if not endpoint.endswith('/'):
@@ -379,17 +614,21 @@ COMPLETE RAW CSV CONTENT:
         "presence_penalty": 0
     }
     
-    print(f"🚀 Sending complete CSV content to Azure OpenAI...")
-    
-    response = requests.post(url, headers=headers, json=payload, timeout=120)  # Increased timeout for large content
-    
-    if response.status_code != 200:
-        raise Exception(f"Azure OpenAI API error: {response.status_code} - {response.text}")
-    
-    result = response.json()
+    logger.debug("🚀 Sending complete CSV content to Azure OpenAI...")
+    
+    # Increased timeout for large content
+    result = await post_json(
+        "azure_openai",
+        url,
+        headers,
+        payload,
+        timeout=120,
+        provider_name="Azure OpenAI",
+        estimated_tokens=input_tokens
+    )
     actual_usage = result.get("usage", {})
     
-    print(f"✅ Response received. Actual tokens used: {actual_usage}")
+    logger.debug("✅ Response received. Actual tokens used: %s", actual_usage)
     
     return {
         "answer": result["choices"][0]["message"]["content"],
@@ -399,13 +638,13 @@ COMPLETE RAW CSV CONTENT:
             "processing_method": "full_content_extraction",
             "data_rows": csv_rows,
             "data_columns": csv_columns,
-            "content_length": len(data_summary),
+            "content_length": content_length,
             "actual_tokens_used": actual_usage,
             "full_content_processed": True
         }
     }
 
-def call_openai_api(file_content, filename, question):
+async def call_openai_api(file_content: bytes, filename: str, question: str) -> Dict[str, Any]:
     """Call OpenAI API with file content"""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -413,7 +652,7 @@ def call_openai_api(file_content, filename, question):
     
     # For OpenAI, we need to decode CSV and send as text
     try:
-        csv_text = file_content.decode('utf-8')
+        csv_text = file_content.decode('utf-8-sig')
     except UnicodeDecodeError:
         raise Exception("Unable to decode CSV file as UTF-8")
     
@@ -423,7 +662,7 @@ def call_openai_api(file_content, filename, question):
     }
     
     payload = {
-        "model": os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview"),
+        "model": get_provider_model("openai"),
         "messages": [
             {
                 "role": "system",
@@ -438,17 +677,14 @@ def call_openai_api(file_content, filename, question):
         "temperature": 0.7
     }
     
-    response = requests.post(
+    result = await post_json(
+        "openai",
         "https://api.openai.com/v1/chat/completions",
-        headers=headers,
-        json=payload,
-        timeout=60
+        headers,
+        payload,
+        timeout=60,
+        provider_name="OpenAI"
     )
-    
-    if response.status_code != 200:
-        raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
-    
-    result = response.json()
     return {
         "answer": result["choices"][0]["message"]["content"],
         "processing_info": {
@@ -458,7 +694,7 @@ def call_openai_api(file_content, filename, question):
         }
     }
 
-def call_google_api(file_content, filename, question):
+async def call_google_api(file_content: bytes, filename: str, question: str) -> Dict[str, Any]:
     """Call Google Gemini API with file content"""
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
@@ -466,11 +702,11 @@ def call_google_api(file_content, filename, question):
     
     # For Google Gemini, decode CSV as text
     try:
-        csv_text = file_content.decode('utf-8')
+        csv_text = file_content.decode('utf-8-sig')
     except UnicodeDecodeError:
         raise Exception("Unable to decode CSV file as UTF-8")
     
-    model = os.getenv("GOOGLE_MODEL", "gemini-pro")
+    model = get_provider_model("google")
     url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
     
     headers = {
@@ -493,12 +729,7 @@ def call_google_api(file_content, filename, question):
         }
     }
     
-    response = requests.post(url, headers=headers, json=payload, timeout=60)
-    
-    if response.status_code != 200:
-        raise Exception(f"Google API error: {response.status_code} - {response.text}")
-    
-    result = response.json()
+    result = await post_json("google", url, headers, payload, timeout=60, provider_name="Google")
     return {
         "answer": result["candidates"][0]["content"]["parts"][0]["text"],
         "processing_info": {
@@ -509,9 +740,9 @@ def call_google_api(file_content, filename, question):
     }
 
 @app.route('/upload-info', methods=['GET'])
-def upload_info():
+async def upload_info():
     """Get information about upload limits and supported formats"""
-    provider = determine_llm_provider()
+    provider = LLM_PROVIDER
     return jsonify({
         "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024),
         "supported_formats": ["csv"],
@@ -520,7 +751,7 @@ def upload_info():
         "available_providers": list(SUPPORTED_PROVIDERS.keys())
     })
 @app.route('/debug-env', methods=['GET'])
-def debug_env():
+async def debug_env():
     """Debug endpoint to check environment variables"""
     # Build Azure OpenAI URL for debugging
     endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "")
@@ -554,15 +785,17 @@ def debug_env():
     })
 if __name__ == '__main__':
     # Validate that at least one LLM provider is configured
-    provider = determine_llm_provider()
+    provider = LLM_PROVIDER
     if not provider:
-        print("Error: No LLM provider configured!")
-        print("Please set one of the following in your .env file:")
-        print("- AZURE_OPENAI_API_KEY for Azure OpenAI GPT-4o (with content extraction)")
-        print("- ANTHROPIC_API_KEY for Claude (with direct file upload)")
-        print("- OPENAI_API_KEY for GPT")
-        print("- GOOGLE_API_KEY for Gemini")
+        logger.error(
+            "No LLM provider configured! Please set one of the following in your .env file:\n"
+            "- AZURE_OPENAI_API_KEY for Azure OpenAI GPT-4o (with content extraction)\n"
+            "- ANTHROPIC_API_KEY for Claude (with direct file upload)\n"
+            "- OPENAI_API_KEY for GPT\n"
+            "- GOOGLE_API_KEY for Gemini"
+        )
         exit(1)
     
-    print(f"Using LLM provider: {provider}")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    logger.info("Using LLM provider: %s", provider)
+    # Development server only - use gunicorn.conf.py in production
+    app.run(debug=os.getenv("QUART_DEBUG") == "1", host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+Gunicorn configuration for running the Quart app in production
+Usage: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+
+# Quart is ASGI - each uvicorn worker runs an event loop serving many concurrent requests
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Under UvicornWorker this is only the worker heartbeat timeout - it never bounds a
+# request. Each LLM call is bounded in the app by MAX_CALL_DURATION (see post_json)
+timeout = 180
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def pre_fork(server, worker):
+    """Tell each new worker how many workers share the provider rate limits"""
+    # Read the live count so -w on the command line (or TTIN/TTOU) is honored
+    os.environ["WEB_CONCURRENCY"] = str(server.num_workers)